@@ -5,6 +5,7 @@
 import pygame
 import config
 import text_display
+import dynamics
 
 from math import cos, sin, pi, atan
 from typing import List
@@ -66,10 +67,16 @@ class Car(pygame.sprite.Sprite):
         self.px = 0
         self.py = 0
         self.vx = 0  # velocity of car in its "x-dir"
-        self.vy = 0  # <-- unused right now, perhaps used for drifting later
+        self.vy = 0  # lateral velocity, only used by the dynamic model
         self.ax = 0
         self.ay = 0
 
+        # Optional dynamic bicycle model with tire slip (for drifting)
+        self.dynamic_model_on = False
+        self.yaw_rate = 0.0                     # rad/s
+        self.cornering_stiffness_in_g = 5.0     # per radian, per axle
+        self.substeps = 1                       # sub-steps in the last frame
+
         # Theta delta, time delta
         self.theta_delta_deg = turning_speed_deg
         self.time_delta = config.time_delta
@@ -77,15 +84,23 @@ class Car(pygame.sprite.Sprite):
         # Previous rectangle and image used to fill in black behind image
         self.prev_image = self.image
         self.rect = self.image.get_rect(topleft=position)
+        # Set when the angle changed without rotating the image (e.g. by
+        # car_state.restore_state), so that update() rotates it once
+        self.image_stale = False
 
         # Screen wrap TRUE or FALSE
         self.screen_wrap_on = True
+        self.speedometer_on = True
         self.speedometer_exists = False
 
+        # Whether the car erases and blits itself; a render.Car_Group
+        # turns this off and draws all of its cars in one batch instead.
+        self.draws_itself = True
+
         # Properties list in string format for var change in debug output
         self.properties = (
             "zero_to_sixty_time_sec", "max_tire_angle_deg", "a_friction_in_g",
-            "a_brake_in_g", "max_v_mph", "screen_wrap_on")
+            "a_brake_in_g", "max_v_mph", "screen_wrap_on", "dynamic_model_on")
 
     @property
     def theta_rad(self):
@@ -144,6 +159,22 @@ class Car(pygame.sprite.Sprite):
         else:
             return atan(self.wheelbase * self.a_max_centripetal / self.vx**2)
 
+    @property
+    def is_at_rest(self):
+        """ Whether the car is stopped, so that updating it without input
+            would change nothing. The tire angle does not matter, since a
+            stopped car neither turns nor straightens its tires.
+        """
+        return (self.vx == 0 and self.vy == 0 and self.ax == 0
+                and self.yaw_rate == 0)
+
+    @property
+    def hitbox_size(self):
+        """ The (length, width) of the hitbox, slightly smaller than the
+            car image.
+        """
+        return (self.width * 0.95, self.height * 0.92)
+
     @property
     def speed_absolute_MPH(self):
         """ Calculates the magnitude of velocity in MPH. """
@@ -196,8 +227,8 @@ class Car(pygame.sprite.Sprite):
             self.vx = max_v
 
         # Compute the new velocities in the global frame
-        self.vx_global = self.vx * cos(theta_rad)
-        self.vy_global = -self.vx * sin(theta_rad)
+        self.vx_global = self.vx * cos(theta_rad) - self.vy * sin(theta_rad)
+        self.vy_global = -self.vx * sin(theta_rad) - self.vy * cos(theta_rad)
 
     def calculate_position(self):
         """ Using the global values of velocity, find the new global position.
@@ -238,9 +269,38 @@ class Car(pygame.sprite.Sprite):
         time_delta = self.time_delta
         self.theta_delta_deg = (vx * sin(phi)/wb * time_delta) * 180/pi
 
+    @property
+    def bicycle_parameters(self):
+        """ The car parameters in the form used by the dynamic model. """
+        return dynamics.bicycle_parameters(
+            wheelbase=self.wheelbase, feet_per_pixel=self.feet_per_pixel,
+            mu_in_g=self.a_max_centripetal_in_g,
+            cornering_stiffness_in_g=self.cornering_stiffness_in_g)
+
+    def calculate_dynamics(self):
+        """ Advances the velocities and yaw rate with the dynamic bicycle
+            model, then turns the car by the resulting angle.
+        """
+        (self.vx, self.vy, self.yaw_rate, d_theta_rad, self.substeps) = \
+            dynamics.dynamic_step(
+                vx=self.vx, vy=self.vy, yaw_rate=self.yaw_rate,
+                delta_rad=self.tire_angle_deg * pi/180,
+                dt=self.time_delta, p=self.bicycle_parameters)
+        self.theta_delta_deg = d_theta_rad * 180/pi
+
+        if self.theta_delta_deg:
+            self.increment_theta()
+            self.rotate_image()
+
     def turn(self):
         """ Performs the image rotation with background correction.
         """
+        # The dynamic model turns and rotates the car on its own in
+        # update(), and tire slip (rather than a hard clamp) limits the
+        # centripetal acceleration, so only the new tire angle applies
+        if self.dynamic_model_on:
+            return
+
         # Perform a check to limit the tire angle based on max centripetal
         # acceleration.
         max_theory_angle = 180/pi * self.max_theoretical_tire_angle_rad
@@ -251,7 +311,13 @@ class Car(pygame.sprite.Sprite):
 
         # Calculate the change in car angle with respect to time
         self.calculate_theta_delta()
+        self.increment_theta()
 
+        self.rotate_image()
+
+    def increment_theta(self):
+        """ Increments the car angle by theta delta, within 0-360 degrees.
+        """
         # Increment the angle
         self.theta_deg += self.theta_delta_deg
         # Correct the angle if outside 360 degree limit
@@ -262,12 +328,17 @@ class Car(pygame.sprite.Sprite):
             if self.theta_deg <= 0:       # if angle below or equal to 0
                 self.theta_deg += 360     # correct it
 
+    def rotate_image(self):
+        """ Rotates the car image to the car angle.
+        """
         # Erase previous image before rotation
-        self.screen.fill(config.BLACK, rect=self.rect)
+        if self.draws_itself:
+            self.screen.fill(config.BLACK, rect=self.rect)
 
         # Rotate the original image according to the global angle
         self.image = pygame.transform.rotate(
             self.original_image, self.theta_deg)
+        self.image_stale = False
 
         # Set the image rect center to be the same as the sprite rect center
         self.rect = self.image.get_rect(topleft=self.rect.center)
@@ -321,8 +392,7 @@ class Car(pygame.sprite.Sprite):
         pygame.draw.rect(self.screen, config.RED, self.rect, 1)
 
         # Determine coordinates of rotated image corners and set to list
-        H = self.height * 0.92      # slightly reduced to shrink the hitbox
-        L = self.width * 0.95
+        (L, H) = self.hitbox_size
 
         # Establish the points to rotate from original frame to another.
         px = self.px_global
@@ -346,6 +416,11 @@ class Car(pygame.sprite.Sprite):
     def update(self):
         """ Update the sprite conditions (pos and vel) on screen.
         """
+        # Catch the image (and the rect size) up with a restored angle
+        if self.image_stale:
+            self.rotate_image()
+            self.rect.center = (self.px_global, self.py_global)
+
         # Check to see if the car should stop accelerating
         self.check_stop_acceleration()
 
@@ -353,20 +428,29 @@ class Car(pygame.sprite.Sprite):
         self.calculate_velocity()
         self.calculate_position()
         self.calculate_acceleration()
-        self.calculate_theta_delta()
+        if self.dynamic_model_on:
+            self.calculate_dynamics()
+        else:
+            # Drop any drift left over from the dynamic model
+            self.vy = 0
+            self.yaw_rate = 0.0
+            self.calculate_theta_delta()
         position = (self.px_global, self.py_global)
 
         # Update the speedometer
-        self.update_speedometer()
+        if self.speedometer_on:
+            self.update_speedometer()
 
         # Erase the old rect with a black fill (optimization reasons)
-        self.screen.fill(config.BLACK, rect=self.rect)
+        if self.draws_itself:
+            self.screen.fill(config.BLACK, rect=self.rect)
 
         # Determine the new center coordinates for the sprite
         self.rect.center = position
 
         # Show the sprite on the screen
-        self.screen.blit(self.image, self.rect)
+        if self.draws_itself:
+            self.screen.blit(self.image, self.rect)
 
         # Update prev image
         self.prev_image = self.image
@@ -0,0 +1,106 @@
+"""
+    This file produces cheap snapshots of the car state for branching
+    rollouts (e.g. search-based planners and what-if tools).
+
+    A state is a flat array of doubles holding, for every car, the fields in
+    STATE_FIELDS followed by the sprite rect (x, y, w, h). No surfaces are
+    copied, so saving, restoring, and forking never touch the car images.
+    The rect is saved for reference only, since it follows from the image.
+"""
+
+from array import array
+from operator import attrgetter
+from typing import List
+
+# Every field that Car.update depends on, in buffer order
+STATE_FIELDS = (
+    # Global position, velocity, and acceleration
+    "px_global", "py_global", "vx_global", "vy_global",
+    "ax_global", "ay_global",
+    # Local position, velocity, and acceleration
+    "px", "py", "vx", "vy", "ax", "ay",
+    # Angles
+    "theta_deg", "tire_angle_deg", "theta_delta_deg", "yaw_rate",
+    # Parameters
+    "max_v_mph", "zero_to_sixty_time_sec", "a_friction_in_g",
+    "a_brake_in_g", "a_max_centripetal_in_g", "feet_per_pixel",
+    "wheelbase", "max_tire_angle_deg", "time_delta",
+    "cornering_stiffness_in_g", "screen_wrap_on", "dynamic_model_on")
+# Fields stored as 0.0/1.0 and restored as bools
+BOOL_FIELDS = ("screen_wrap_on", "dynamic_model_on")
+RECT_FIELDS = ("x", "y", "w", "h")
+STATE_SIZE = len(STATE_FIELDS) + len(RECT_FIELDS)
+# Position of every field within one car's slot of a buffer
+STATE_INDEX = {name: index for (index, name)
+               in enumerate(STATE_FIELDS + RECT_FIELDS)}
+
+get_fields = attrgetter(*STATE_FIELDS)
+get_rect = attrgetter(*RECT_FIELDS)
+
+
+def slot_start(state: array, index: int) -> int:
+    """ Returns where the index-th car slot of a buffer starts, raising an
+        IndexError if the buffer does not hold that slot.
+    """
+    start = index * STATE_SIZE
+    if index < 0 or start + STATE_SIZE > len(state):
+        raise IndexError(f"State slot {index} is out of range for a buffer "
+                         f"of {len(state) // STATE_SIZE} slots.")
+    return start
+
+
+def save_state(car, out: array = None, index: int = 0) -> array:
+    """ Captures the state of a car as a flat array of doubles.
+
+        If out is given, the state is written in place into the index-th
+        slot of that buffer (e.g. one made by save_fleet_state or fork)
+        instead of allocating a new array.
+    """
+    if out is None:
+        state = array('d', get_fields(car))
+        state.extend(get_rect(car.rect))
+        return state
+    start = slot_start(out, index)
+    out[start:start + STATE_SIZE] = array(
+        'd', get_fields(car) + get_rect(car.rect))
+    return out
+
+
+def restore_state(car, state: array, index: int = 0) -> None:
+    """ Restores the index-th car state of a buffer onto a car.
+
+        The sprite image and rect are not restored; the car is marked so
+        that its next update rotates the image to the restored angle and
+        takes the rect from it. Until then the rect still covers the image
+        last drawn, so it is erased in the right place.
+    """
+    start = slot_start(state, index)
+    values = state[start:start + len(STATE_FIELDS)]
+    for name, value in zip(STATE_FIELDS, values):
+        setattr(car, name, value)
+    for name in BOOL_FIELDS:
+        setattr(car, name, bool(getattr(car, name)))
+    car.image_stale = True
+
+
+def save_fleet_state(cars: List) -> array:
+    """ Captures the states of a list of cars in one flat buffer. """
+    state = array('d')
+    for car in cars:
+        state.extend(get_fields(car))
+        state.extend(get_rect(car.rect))
+    return state
+
+
+def restore_fleet_state(cars: List, state: array) -> None:
+    """ Restores a fleet buffer onto a list of cars (in the same order). """
+    for index, car in enumerate(cars):
+        restore_state(car, state, index)
+
+
+def fork(state: array, n: int) -> array:
+    """ Clones a car (or fleet) state into n independent copies, laid out
+        back to back in one buffer. For a fleet of m cars, car j of copy k
+        is at index k * m + j for restore_state and save_state.
+    """
+    return state * n
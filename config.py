@@ -13,6 +13,11 @@ RESOLUTION = (DISPLAY_WIDTH, DISPLAY_HEIGHT)
 FPS = 120
 time_delta = 1/FPS
 
+# Stop drawing frames while nothing moves, waking up on input (or every
+# idle_wait_ms milliseconds to check again)
+idle_throttling_on = True
+idle_wait_ms = 500
+
 # Establish colors
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -27,3 +32,9 @@ font = "VeraMono.ttf"
 # File paths
 image_player_car = str(Path("Images/orange_car.png"))
 image_enemy_car = str(Path("Images/gray_car.png"))
+
+# Telemetry stream (UDP (host, port) tuple, or a Unix socket path string)
+telemetry_on = False
+telemetry_address = ("127.0.0.1", 50007)
+telemetry_batch_frames = 8
+telemetry_max_bytes = 8192
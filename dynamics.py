@@ -0,0 +1,188 @@
+"""
+    This file produces the optional dynamic bicycle model of the car, which
+    adds tire slip, lateral velocity, and yaw rate on top of the kinematic
+    (Ackermann) steering used by default.
+
+    Forces are per unit mass (pixels/s^2) and angles are in radians. The
+    local frame has +x forward and +y to the left of the car, matching
+    Car.theta_deg, which increases when turning left.
+
+    Run this file directly to compare the cost of the dynamic model with
+    the kinematic model per simulated second.
+"""
+
+import config
+
+from math import atan2, ceil, cos, hypot, pi, sin
+from time import perf_counter
+from typing import NamedTuple, Tuple
+
+
+class Bicycle_Parameters(NamedTuple):
+    """ Parameters of the dynamic bicycle model, in pixel units. """
+    lf: float                   # center of mass to front axle
+    lr: float                   # center of mass to rear axle
+    k2: float                   # yaw inertia per unit mass (radius^2)
+    c_f: float                  # front cornering stiffness per unit mass
+    c_r: float                  # rear cornering stiffness per unit mass
+    f_max_f: float              # front lateral force limit per unit mass
+    f_max_r: float              # rear lateral force limit per unit mass
+    v_min: float                # below this speed, use the kinematic model
+    max_substeps: int = 64
+    max_slip_step_rad: float = 0.02
+    stability: float = 1.0      # largest h * (stiffest eigenvalue) allowed
+
+
+def bicycle_parameters(wheelbase: float,
+                       feet_per_pixel: float,
+                       mu_in_g: float,
+                       cornering_stiffness_in_g: float,
+                       v_min_mph: float = 5.0) -> Bicycle_Parameters:
+    """ Converts the car parameters to bicycle model parameters, with the
+        center of mass halfway along the wheelbase.
+    """
+    g = 32.2 / feet_per_pixel
+    lf = lr = wheelbase / 2
+    c = cornering_stiffness_in_g * g
+    return Bicycle_Parameters(
+        lf=lf, lr=lr, k2=lf * lr, c_f=c, c_r=c,
+        f_max_f=mu_in_g * g * lr / wheelbase,
+        f_max_r=mu_in_g * g * lf / wheelbase,
+        v_min=v_min_mph * 5280/3600 / feet_per_pixel)
+
+
+def slip_derivatives(vx: float, vy: float, yaw_rate: float,
+                     delta_rad: float,
+                     p: Bicycle_Parameters) -> Tuple[float, float, float]:
+    """ Returns the time derivatives of forward velocity, lateral velocity,
+        and yaw rate due to the tire forces and the rotating frame (the
+        throttle and brakes are left to the longitudinal model). Tire forces
+        are linear in slip angle up to the friction limit.
+    """
+    alpha_f = delta_rad - atan2(vy + p.lf * yaw_rate, vx)
+    alpha_r = -atan2(vy - p.lr * yaw_rate, vx)
+    fy_f = max(-p.f_max_f, min(p.f_max_f, p.c_f * alpha_f))
+    fy_r = max(-p.f_max_r, min(p.f_max_r, p.c_r * alpha_r))
+    fy_f_lateral = fy_f * cos(delta_rad)
+    # The steered front tire drags the car back, and a sideways slide turns
+    # into forward motion as the car rotates (and the other way round)
+    dvx = vy * yaw_rate - fy_f * sin(delta_rad)
+    dvy = fy_f_lateral + fy_r - vx * yaw_rate
+    dyaw = (p.lf * fy_f_lateral - p.lr * fy_r) / p.k2
+    return dvx, dvy, dyaw
+
+
+def substep_count(vx: float, dvy: float, dyaw: float, dt: float,
+                  p: Bicycle_Parameters) -> int:
+    """ Picks how many sub-steps the frame needs. The slip dynamics are
+        stiff when the stiffest eigenvalue of the linearized model is large
+        compared to the frame, or when the slip angles are changing fast
+        (e.g. a large steering input at high speed).
+    """
+    eigenvalue = (p.c_f + p.c_r
+                  + (p.lf**2 * p.c_f + p.lr**2 * p.c_r) / p.k2) / vx
+    slip_rate = (abs(dvy) + max(p.lf, p.lr) * abs(dyaw)) / vx
+    n = max(dt * eigenvalue / p.stability,
+            dt * slip_rate / p.max_slip_step_rad)
+    return max(1, min(p.max_substeps, ceil(n)))
+
+
+def dynamic_step(vx: float, vy: float, yaw_rate: float, delta_rad: float,
+                 dt: float, p: Bicycle_Parameters
+                 ) -> Tuple[float, float, float, float, int]:
+    """ Advances the velocities and yaw rate by one frame using adaptive
+        midpoint (RK2) sub-steps. The throttle and brakes are applied to vx
+        beforehand by the longitudinal model; this adds the tire drag and
+        the exchange between forward and lateral velocity, so a spinning
+        car scrubs off speed instead of sliding away.
+
+        Returns (vx, vy, yaw_rate, change in heading [rad], substeps).
+    """
+    # Slip angles are undefined at a standstill, so fall back to kinematic
+    if vx < p.v_min:
+        yaw_rate = vx * sin(delta_rad) / (p.lf + p.lr)
+        return vx, 0.0, yaw_rate, yaw_rate * dt, 1
+
+    (dvx, dvy, dyaw) = slip_derivatives(vx, vy, yaw_rate, delta_rad, p)
+    n = substep_count(vx, dvy, dyaw, dt, p)
+    h = dt / n
+    d_theta = 0.0
+    for _ in range(n):
+        # Midpoint method, reusing the derivatives at the start of the step
+        vx_mid = vx + dvx * h/2
+        vy_mid = vy + dvy * h/2
+        yaw_mid = yaw_rate + dyaw * h/2
+        (dvx_mid, dvy_mid, dyaw_mid) = slip_derivatives(
+            vx_mid, vy_mid, yaw_mid, delta_rad, p)
+        vx += dvx_mid * h
+        vy += dvy_mid * h
+        yaw_rate += dyaw_mid * h
+        d_theta += yaw_mid * h
+        (dvx, dvy, dyaw) = slip_derivatives(vx, vy, yaw_rate, delta_rad, p)
+    return vx, vy, yaw_rate, d_theta, n
+
+
+def kinematic_step(vx: float, delta_rad: float, dt: float,
+                   wheelbase: float) -> float:
+    """ The kinematic heading change used by Car.calculate_theta_delta. """
+    return vx * sin(delta_rad) / wheelbase * dt
+
+
+def benchmark(simulated_sec: float = 10.0, fps: int = config.FPS) -> None:
+    """ Prints the wall time and steps per simulated second of the dynamic
+        and kinematic models for a few driving scenarios at a frame rate,
+        and the speed at the end of the scenario. After the spin-out the
+        dynamic car should have slowed down, not sped up.
+    """
+    # Same geometry as the default Car
+    width = int(0.10 * config.DISPLAY_WIDTH)
+    feet_per_pixel = 15 / width
+    wheelbase = width * 0.70
+    p = bicycle_parameters(wheelbase, feet_per_pixel, mu_in_g=0.94,
+                           cornering_stiffness_in_g=5.0)
+    mph = 5280/3600 / feet_per_pixel
+    dt = 1/fps
+    frames = int(simulated_sec / dt)
+
+    # (name, forward speed, steering angle as a function of frame)
+    scenarios = (
+        ("cruise, light steering", 40 * mph,
+         lambda i: 2 * sin(i * dt) * pi/180),
+        ("highway, hard steering", 110 * mph,
+         lambda i: (20 if (i * dt) % 1 < 0.5 else -20) * pi/180),
+        ("parking lot, full lock", 8 * mph,
+         lambda i: 45 * pi/180),
+        # Full left lock, then full right lock, then the tires straight
+        ("spin-out, 120 mph flick", 120 * mph,
+         lambda i: (45 if i * dt < 0.5 else -45 if i * dt < 1.25 else 0)
+         * pi/180))
+
+    print(f"{fps} FPS")
+    print(f"{'scenario':<24}{'model':<11}"
+          f"{'steps/sim s':>12}{'us/sim s':>12}{'end mph':>9}")
+    for (name, vx, steer) in scenarios:
+        start = perf_counter()
+        for i in range(frames):
+            kinematic_step(vx, steer(i), dt, wheelbase)
+        kinematic_us = (perf_counter() - start) * 1e6 / simulated_sec
+
+        start = perf_counter()
+        (v, vy, yaw_rate, steps) = (vx, 0.0, 0.0, 0)
+        for i in range(frames):
+            (v, vy, yaw_rate, _, n) = dynamic_step(
+                v, vy, yaw_rate, steer(i), dt, p)
+            steps += n
+        dynamic_us = (perf_counter() - start) * 1e6 / simulated_sec
+
+        print(f"{name:<24}{'kinematic':<11}"
+              f"{frames / simulated_sec:>12.0f}{kinematic_us:>12.0f}"
+              f"{vx / mph:>9.1f}")
+        print(f"{'':<24}{'dynamic':<11}"
+              f"{steps / simulated_sec:>12.0f}{dynamic_us:>12.0f}"
+              f"{hypot(v, vy) / mph:>9.1f}")
+
+
+if __name__ == '__main__':
+    # The frame rate of the game, then a coarse one where slip gets stiff
+    benchmark(fps=config.FPS)
+    benchmark(fps=15)
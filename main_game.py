@@ -2,6 +2,8 @@ import pygame
 import config
 import car
 import debug_output
+import render
+import telemetry
 
 
 # TODO: GRAY means complete. RED means important.
@@ -45,6 +47,10 @@ def main_loop():
         position=(config.DISPLAY_WIDTH/2, config.DISPLAY_HEIGHT/2),
         image_path=config.image_player_car)
 
+    # Create the render layer that draws every car in one batch
+    all_cars = render.Car_Group(screen)
+    all_cars.add(player_car)
+
     # Establish the main loop
     screen.fill(config.BLACK)
 
@@ -53,9 +59,27 @@ def main_loop():
     if DEBUGGING:
         player_car_info = debug_output.Player_Car_Info(player_car, screen)
 
+    # Create the telemetry stream, an alternative to the debug text
+    if config.telemetry_on:
+        telemetry_publisher = telemetry.Telemetry_Publisher()
+
+    # Keys that change the car while they are held down
+    driving_keys = (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT)
+
     crashed = False
+    idle = False
     while not crashed:
-        for event in pygame.event.get():
+        # While every car is at rest and no key is held, the next frame would
+        # be identical, so sleep until input arrives instead of drawing it
+        if idle:
+            event = pygame.event.wait(config.idle_wait_ms)
+            if event.type == pygame.NOEVENT:
+                continue
+            events = [event] + pygame.event.get()
+        else:
+            events = pygame.event.get()
+
+        for event in events:
             if event.type == pygame.QUIT:
                 crashed = True
                 break
@@ -64,6 +88,8 @@ def main_loop():
             if event.type == pygame.KEYDOWN:
                 # Quits the game on ESCAPE
                 if event.key == pygame.K_ESCAPE:
+                    if config.telemetry_on:
+                        telemetry_publisher.close()
                     pygame.quit()
                     quit()
                 # If the UP KEY is pressed, cause the car to accelerate
@@ -102,8 +128,13 @@ def main_loop():
         if keys_pressed[pygame.K_DOWN]:
             player_car.brake()
 
-        # Update and draw player car on the screen
-        player_car.update()
+        # Update the cars, then draw them all on the screen
+        all_cars.update()
+        all_cars.draw()
+
+        # Publish the car states to the telemetry stream
+        if config.telemetry_on:
+            telemetry_publisher.publish(all_cars)
 
         # If debug mode is on, update the debug text
         if DEBUGGING:
@@ -112,12 +143,24 @@ def main_loop():
         if player_car_info.IS_OPEN:
             player_car_info.open_console()
 
+        # Go idle once nothing will change until the player presses a key
+        idle = (config.idle_throttling_on
+                and not any(keys_pressed[key] for key in driving_keys)
+                and all(a_car.is_at_rest for a_car in all_cars))
+        # Send the telemetry still batched before going idle
+        if idle and config.telemetry_on:
+            telemetry_publisher.flush()
+
         # Update the screen
         pygame.display.flip()
 
         # Move one frame
         clock.tick(config.FPS)
 
+    # Send the last batch of telemetry and release the socket
+    if config.telemetry_on:
+        telemetry_publisher.close()
+
 
 if __name__ == '__main__':
     main_loop()
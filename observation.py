@@ -0,0 +1,187 @@
+"""
+    This file produces headless, egocentric top-down observations of the
+    cars for vision-based controllers.
+
+    Every car gets a small square raster centered on itself and facing up,
+    written straight into a preallocated uint8 batch array of shape
+    (cars, channels, resolution, resolution), without a display or any
+    blits. The channels are the road map, the obstacle map, and the other
+    cars drawn as their rotated hitbox rectangles (0 or 255).
+
+    Requires numpy.
+"""
+
+import numpy as np
+import car_state
+
+from math import ceil, pi, sqrt
+from typing import Iterable, Tuple
+
+ROAD, OBSTACLES, CARS = 0, 1, 2
+N_CHANNELS = 3
+
+
+class Observation_Rasterizer:
+    """ Rasterizes egocentric observations for a batch of car poses.
+
+        road_map and obstacle_map are optional (DISPLAY_HEIGHT,
+        DISPLAY_WIDTH) uint8 arrays in screen pixels, which are sampled
+        as they are; anything outside of them reads as 0. hitbox is the
+        (length, width) of Car.hitbox_size.
+    """
+    def __init__(self,
+                 hitbox: Tuple[float, float],
+                 resolution: int = 64,
+                 view_size: float = 280.0,
+                 road_map: np.ndarray = None,
+                 obstacle_map: np.ndarray = None,
+                 pair_chunk: int = 4096) -> None:
+        self.resolution = resolution
+        self.view_size = view_size
+        self.road_map = road_map
+        self.obstacle_map = obstacle_map
+        (self.half_length, self.half_width) = (hitbox[0] / 2, hitbox[1] / 2)
+        self.pair_chunk = pair_chunk
+
+        # Pixel centers in the car frame of rotation_transformation (+x
+        # forward, +y to the right of the car), with forward up the image
+        # and the car's left on the left of the image
+        scale = view_size / resolution
+        offsets = (np.arange(resolution) + 0.5 - resolution/2) * scale
+        (rows, cols) = np.meshgrid(offsets, offsets, indexing='ij')
+        self.grid_x = -rows.ravel()
+        self.grid_y = cols.ravel()
+
+        # Other cars further away than this cannot touch the view, and a
+        # window this many pixels wide always covers a car's hitbox
+        car_radius = sqrt(self.half_length**2 + self.half_width**2)
+        self.cull_distance = view_size / sqrt(2) + car_radius
+        self.window = 2 * ceil(car_radius / scale) + 2
+
+    def allocate(self, n_cars: int) -> np.ndarray:
+        """ Creates an output batch array for n_cars observations. """
+        return np.zeros((n_cars, N_CHANNELS, self.resolution,
+                         self.resolution), dtype=np.uint8)
+
+    def pixel_positions(self, px, py, theta_deg) -> Tuple[np.ndarray,
+                                                          np.ndarray]:
+        """ Returns the (N, P) screen coordinates of every raster pixel,
+            using the rotation_transformation pose math for all cars at once.
+        """
+        th = np.asarray(theta_deg) * pi/180
+        cos_th = np.cos(th)[:, None]
+        sin_th = np.sin(th)[:, None]
+        (gx, gy) = (self.grid_x, self.grid_y)
+        wx = cos_th * gx + sin_th * gy + np.asarray(px)[:, None]
+        wy = -sin_th * gx + cos_th * gy + np.asarray(py)[:, None]
+        return wx, wy
+
+    def sample_map(self, world_map: np.ndarray, wx: np.ndarray,
+                   wy: np.ndarray, out: np.ndarray) -> None:
+        """ Writes the nearest map pixel under every raster pixel into out.
+        """
+        if world_map is None:
+            out[...] = 0
+            return
+        (height, width) = world_map.shape
+        col = np.floor(wx).astype(np.intp)
+        row = np.floor(wy).astype(np.intp)
+        outside = (col < 0) | (col >= width) | (row < 0) | (row >= height)
+        index = row * width + col
+        np.take(world_map.ravel(), index.reshape(out.shape), mode='clip',
+                out=out)
+        np.putmask(out, outside.reshape(out.shape), 0)
+
+    def car_mask(self, px, py, theta_deg) -> np.ndarray:
+        """ Returns an (N, P) mask of the raster pixels covered by the
+            hitboxes of the other cars. Only a small window of pixels around
+            each nearby car is tested.
+        """
+        R = self.resolution
+        scale = self.view_size / R
+        px = np.asarray(px, dtype=float)
+        py = np.asarray(py, dtype=float)
+        theta_deg = np.asarray(theta_deg, dtype=float)
+        th = theta_deg * pi/180
+        (cos_th, sin_th) = (np.cos(th), np.sin(th))
+        mask = np.zeros((len(px), R * R), dtype=bool)
+        flat_mask = mask.ravel()
+
+        # Pairs of (ego car, other car) close enough to show up
+        near = ((px[:, None] - px)**2 + (py[:, None] - py)**2
+                <= self.cull_distance**2)
+        np.fill_diagonal(near, False)
+        (egos, others) = np.nonzero(near)
+
+        window = np.arange(self.window) - self.window // 2
+        for start in range(0, len(egos), self.pair_chunk):
+            ego = egos[start:start + self.pair_chunk]
+            other = others[start:start + self.pair_chunk]
+
+            # Other car position in the ego frame (inverse of
+            # rotation_transformation), then in raster rows and columns
+            dx = px[other] - px[ego]
+            dy = py[other] - py[ego]
+            (c, s) = (cos_th[ego], sin_th[ego])
+            lx = c * dx - s * dy
+            ly = s * dx + c * dy
+            row_center = np.floor(R/2 - lx / scale).astype(np.intp)
+            col_center = np.floor(R/2 + ly / scale).astype(np.intp)
+            rows = (row_center[:, None] + window)[:, :, None]
+            cols = (col_center[:, None] + window)[:, None, :]
+
+            # Window pixel centers relative to the other car, rotated by the
+            # relative angle into the other car's frame
+            ux = (R/2 - 0.5 - rows) * scale - lx[:, None, None]
+            uy = (cols + 0.5 - R/2) * scale - ly[:, None, None]
+            phi = (theta_deg[other] - theta_deg[ego]) * pi/180
+            cos_phi = np.cos(phi)[:, None, None]
+            sin_phi = np.sin(phi)[:, None, None]
+            inside = ((np.abs(cos_phi * ux - sin_phi * uy)
+                       <= self.half_length)
+                      & (np.abs(sin_phi * ux + cos_phi * uy)
+                         <= self.half_width)
+                      & (rows >= 0) & (rows < R) & (cols >= 0) & (cols < R))
+
+            index = ego[:, None, None] * (R * R) + rows * R + cols
+            flat_mask[index[inside]] = True
+        return mask
+
+    def render(self, px, py, theta_deg, out: np.ndarray = None
+               ) -> np.ndarray:
+        """ Rasterizes observations for N cars given their global positions
+            and angles, as (N,) arrays, into out (see allocate).
+        """
+        n_cars = len(px)
+        if out is None:
+            out = self.allocate(n_cars)
+        if self.road_map is None and self.obstacle_map is None:
+            out[:, ROAD] = 0
+            out[:, OBSTACLES] = 0
+        else:
+            (wx, wy) = self.pixel_positions(px, py, theta_deg)
+            self.sample_map(self.road_map, wx, wy, out[:, ROAD])
+            self.sample_map(self.obstacle_map, wx, wy, out[:, OBSTACLES])
+        mask = self.car_mask(px, py, theta_deg)
+        np.multiply(mask.reshape(out[:, CARS].shape), 255, out=out[:, CARS],
+                    casting='unsafe')
+        return out
+
+
+def poses_from_cars(cars: Iterable) -> Tuple[np.ndarray, np.ndarray,
+                                             np.ndarray]:
+    """ Returns the (px, py, theta_deg) arrays of a list of cars. """
+    poses = np.array([(car.px_global, car.py_global, car.theta_deg)
+                      for car in cars], dtype=float).reshape(-1, 3)
+    return poses[:, 0], poses[:, 1], poses[:, 2]
+
+
+def poses_from_fleet_state(state) -> Tuple[np.ndarray, np.ndarray,
+                                           np.ndarray]:
+    """ Returns the (px, py, theta_deg) arrays of every car in a car_state
+        buffer, as views into the buffer (no copy).
+    """
+    i = car_state.STATE_INDEX
+    fleet = np.frombuffer(state, dtype=float).reshape(-1, car_state.STATE_SIZE)
+    return (fleet[:, i["px_global"]], fleet[:, i["py_global"]],
+            fleet[:, i["theta_deg"]])
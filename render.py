@@ -0,0 +1,81 @@
+"""
+    This file produces the render layer that draws every car in one batch.
+"""
+
+import pygame
+import config
+
+
+class Car_Group(pygame.sprite.LayeredUpdates):
+    """ A layered sprite group that draws all of its cars at once.
+
+        Cars added to the group stop erasing and blitting themselves.
+        Instead, every frame the group restores the background behind
+        the rects drawn on the previous frame, culls the cars that are
+        outside of the screen, and blits the visible ones with a single
+        Surface.blits call.
+    """
+    def __init__(self, screen, background=None) -> None:
+        pygame.sprite.LayeredUpdates.__init__(self)
+        self.screen = screen
+        self.screen_rect = screen.get_rect()
+
+        # The background is a full screen surface so that clearing the old
+        # rects is one batched blit instead of one fill per car.
+        if background is None:
+            background = pygame.Surface(self.screen_rect.size).convert()
+            background.fill(config.BLACK)
+        self.background = background
+
+        # Rects drawn on the previous frame, erased at the next draw
+        self.prev_rects = []
+
+    def add_internal(self, sprite, layer=None):
+        """ Adds a car to the group and hands its drawing over to the group.
+        """
+        pygame.sprite.LayeredUpdates.add_internal(self, sprite, layer)
+        sprite.draws_itself = False
+
+    def remove_internal(self, sprite):
+        """ Removes a car from the group and lets it draw itself again.
+        """
+        pygame.sprite.LayeredUpdates.remove_internal(self, sprite)
+        sprite.draws_itself = True
+
+    def visible_sprites(self) -> list:
+        """ Returns the cars (in layer order) whose rect is on the screen.
+        """
+        colliderect = self.screen_rect.colliderect
+        return [sprite for sprite in self.sprites()
+                if colliderect(sprite.rect)]
+
+    def clear_background(self):
+        """ Restores the background behind every rect drawn last frame.
+        """
+        background = self.background
+        self.screen.blits([(background, rect, rect)
+                           for rect in self.prev_rects], doreturn=False)
+
+    def draw(self, surface=None) -> list:
+        """ Clears the previous frame and draws all visible cars.
+
+            Returns the list of rects that changed on the screen, which
+            can be passed to pygame.display.update.
+        """
+        if surface is not None and surface is not self.screen:
+            self.screen = surface
+            self.screen_rect = surface.get_rect()
+
+        # Clear the background once for the whole group
+        self.clear_background()
+
+        # Blit every visible car in one call
+        visible = self.visible_sprites()
+        self.screen.blits([(sprite.image, sprite.rect) for sprite in visible],
+                          doreturn=False)
+
+        # Remember the drawn rects so they are erased on the next frame
+        drawn_rects = [sprite.rect.copy() for sprite in visible]
+        dirty_rects = self.prev_rects + drawn_rects
+        self.prev_rects = drawn_rects
+        return dirty_rects
@@ -0,0 +1,165 @@
+"""
+    This file produces a binary telemetry stream of the car states, which
+    external dashboards can read instead of the on-screen debug text.
+
+    Each datagram is a header followed by fixed-layout car records:
+        header: magic (4s), version (B), record count (H)
+        record: frame (I), car id (H), px, py, vx, vy, ax, ay,
+                theta_deg, tire_angle_deg (8 float32)
+    All values are little-endian. Several frames are batched per datagram.
+
+    Run this file directly to start a reference listener.
+"""
+
+import os
+import socket
+import struct
+import config
+
+from typing import Iterable, List, Tuple, Union
+
+MAGIC = b"CARS"
+VERSION = 1
+HEADER = struct.Struct("<4sBH")
+RECORD = struct.Struct("<IH8f")
+
+
+def make_socket(address: Union[tuple, str]) -> socket.socket:
+    """ Creates a datagram socket for the address. A tuple address
+        (host, port) uses UDP and a string address is a Unix socket path.
+    """
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+
+class Telemetry_Publisher:
+    """ Packs the state of every car into binary records and sends them
+        in batches of several frames per datagram. Sending never blocks;
+        if the consumer falls behind (or is not running), the batch is
+        dropped and counted in datagrams_dropped.
+    """
+    def __init__(self,
+                 address: Union[tuple, str] = config.telemetry_address,
+                 frames_per_datagram: int = config.telemetry_batch_frames,
+                 max_datagram_bytes: int = config.telemetry_max_bytes
+                 ) -> None:
+        self.address = address
+        self.sock = make_socket(address)
+        self.sock.setblocking(False)
+        self.frames_per_datagram = frames_per_datagram
+
+        # Preallocated datagram buffer, filled in place every frame
+        max_records = (max_datagram_bytes - HEADER.size) // RECORD.size
+        if max_records < 1:
+            raise ValueError(f"max_datagram_bytes={max_datagram_bytes} "
+                             "cannot hold a single record.")
+        self.max_records = max_records
+        self.buffer = bytearray(HEADER.size + max_records * RECORD.size)
+        self.record_count = 0
+        self.frames_batched = 0
+
+        # Frame counter and statistics
+        self.frame = 0
+        self.datagrams_sent = 0
+        self.datagrams_dropped = 0
+
+    def publish(self, cars: Iterable) -> None:
+        """ Adds one frame of car states to the batch. The batch is sent
+            once it holds frames_per_datagram frames or the buffer is full.
+        """
+        pack_into = RECORD.pack_into
+        buffer = self.buffer
+        frame = self.frame & 0xFFFFFFFF
+        for car_id, car in enumerate(cars):
+            if self.record_count == self.max_records:
+                self.flush()
+            offset = HEADER.size + self.record_count * RECORD.size
+            pack_into(buffer, offset, frame, car_id & 0xFFFF,
+                      car.px_global, car.py_global,
+                      car.vx_global, car.vy_global,
+                      car.ax_global, car.ay_global,
+                      car.theta_deg, car.tire_angle_deg)
+            self.record_count += 1
+
+        self.frame += 1
+        self.frames_batched += 1
+        if self.frames_batched >= self.frames_per_datagram:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Sends the batched records, dropping them if the socket would
+            block or nobody is listening.
+        """
+        self.frames_batched = 0
+        if not self.record_count:
+            return
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, self.record_count)
+        size = HEADER.size + self.record_count * RECORD.size
+        self.record_count = 0
+        try:
+            self.sock.sendto(memoryview(self.buffer)[:size], self.address)
+            self.datagrams_sent += 1
+        except OSError:
+            # Full send buffer, refused port, or missing Unix socket path
+            self.datagrams_dropped += 1
+
+    def close(self) -> None:
+        """ Sends whatever is left in the batch and closes the socket. """
+        self.flush()
+        self.sock.close()
+
+
+def unpack_datagram(datagram: bytes) -> List[Tuple]:
+    """ Unpacks a telemetry datagram into a list of record tuples:
+        (frame, car_id, px, py, vx, vy, ax, ay, theta_deg, tire_angle_deg)
+    """
+    (magic, version, count) = HEADER.unpack_from(datagram, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} telemetry datagram.")
+    return list(RECORD.iter_unpack(
+        datagram[HEADER.size:HEADER.size + count * RECORD.size]))
+
+
+class Telemetry_Listener:
+    """ A reference consumer for the telemetry stream, for testing. """
+    def __init__(self,
+                 address: Union[tuple, str] = config.telemetry_address
+                 ) -> None:
+        self.address = address
+        self.sock = make_socket(address)
+        # Remove a Unix socket path left over from a previous listener
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+        self.sock.bind(address)
+
+    def receive(self, timeout: float = None) -> List[Tuple]:
+        """ Waits for one datagram and returns its records, or an empty
+            list if the timeout passes first.
+        """
+        self.sock.settimeout(timeout)
+        try:
+            datagram = self.sock.recv(65535)
+        except socket.timeout:
+            return []
+        return unpack_datagram(datagram)
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    listener = Telemetry_Listener()
+    print(f"Listening for telemetry on {listener.address}")
+    try:
+        while True:
+            for record in listener.receive():
+                (frame, car_id, px, py, vx, vy, ax, ay,
+                 theta_deg, tire_angle_deg) = record
+                print(f"frame: {frame: >8}, car: {car_id: >3}, "
+                      f"px: {px: >8.2f}, py: {py: >8.2f}, "
+                      f"vx: {vx: >8.2f}, vy: {vy: >8.2f}, "
+                      f"angle: {theta_deg: >7.2f}, "
+                      f"tire: {tire_angle_deg: >6.2f}")
+    except KeyboardInterrupt:
+        listener.close()
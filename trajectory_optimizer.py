@@ -0,0 +1,501 @@
+"""
+    This file produces an offline maneuver optimizer, which searches for the
+    control sequence (throttle/brake/steer per frame) that best achieves a
+    goal such as the minimum time through a list of waypoints or the
+    tightest U-turn.
+
+    It uses the cross-entropy method (CEM): every iteration samples a
+    thousand or more random control sequences from action probabilities,
+    simulates them all at once with a vectorized copy of the Car physics,
+    and moves the probabilities towards the best (elite) sequences.
+
+    Requires numpy. Run this file directly for a timed demo.
+"""
+
+import numpy as np
+import car_state
+
+from math import pi
+from time import perf_counter
+from typing import NamedTuple, Sequence, Tuple
+
+# Control values, mapped to the Car methods called in main_game.main_loop
+COAST, THROTTLE, BRAKE = 0, 1, 2
+RIGHT, STRAIGHT, LEFT = 0, 1, 2
+THROTTLE_ACTIONS = ("decelerate_frictionally", "accelerate", "brake")
+STEER_ACTIONS = ("turn_right", "turn_none", "turn_left")
+
+
+class Rollout_Parameters(NamedTuple):
+    """ Car parameters in pixel units, as used by the rollouts. """
+    max_a: float
+    max_v: float
+    a_friction: float
+    a_brake: float
+    a_max_centripetal: float
+    wheelbase: float
+    max_tire_angle_deg: float
+    time_delta: float
+
+
+class Optimization_Result(NamedTuple):
+    """ The best control sequence found, plus what is needed to warm
+        start another optimization.
+    """
+    throttle: np.ndarray        # (T,) of COAST, THROTTLE, BRAKE
+    steer: np.ndarray           # (T,) of RIGHT, STRAIGHT, LEFT
+    cost: float
+    iterations: int
+    throttle_probs: np.ndarray  # (D, 3) probabilities per decision
+    steer_probs: np.ndarray     # (D, 3) probabilities per decision
+    cost_history: list          # best cost after each iteration
+
+
+def rollout_parameters(state) -> Rollout_Parameters:
+    """ Reads the car parameters out of a car_state buffer (the same
+        conversions as the Car properties).
+
+        The rollout only models the kinematic car, so a state with the
+        dynamic model on raises a ValueError.
+    """
+    i = car_state.STATE_INDEX
+    if state[i["dynamic_model_on"]]:
+        raise ValueError("The rollout only supports the kinematic model; "
+                         "turn dynamic_model_on off first.")
+    fpp = state[i["feet_per_pixel"]]
+    return Rollout_Parameters(
+        max_a=60 / state[i["zero_to_sixty_time_sec"]] * 5280/3600 / fpp,
+        max_v=state[i["max_v_mph"]] * 5280/3600 / fpp,
+        a_friction=state[i["a_friction_in_g"]] * 32.2 / fpp,
+        a_brake=state[i["a_brake_in_g"]] * 32.2 / fpp,
+        a_max_centripetal=state[i["a_max_centripetal_in_g"]] * 32.2 / fpp,
+        wheelbase=state[i["wheelbase"]],
+        max_tire_angle_deg=state[i["max_tire_angle_deg"]],
+        time_delta=state[i["time_delta"]])
+
+
+def sin_cos_deg(angle_deg: np.ndarray, sin_out: np.ndarray,
+                cos_out: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Writes the sine and cosine of angles in degrees into sin_out and
+        cos_out, from the tangent of the half angle. numpy vectorizes np.tan
+        but computes the float64 np.sin and np.cos one value at a time, so
+        this is several times faster, and accurate to a few ulp.
+    """
+    u = np.tan(np.multiply(angle_deg, pi/360, out=sin_out), out=sin_out)
+    u_squared = np.multiply(u, u, out=cos_out)
+    denominator = u_squared + 1.0
+    np.subtract(1.0, u_squared, out=cos_out)
+    cos_out /= denominator
+    u *= 2.0
+    u /= denominator
+    return sin_out, cos_out
+
+
+def rollout(state, throttle: np.ndarray, steer: np.ndarray,
+            out: Tuple[np.ndarray, np.ndarray, np.ndarray] = None,
+            block_size: int = 32768
+            ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Simulates K control sequences of T frames from a car_state buffer,
+        all at once. throttle and steer are (K, T) integer arrays.
+
+        This mirrors the kinematic Car model frame by frame (throttle, then
+        steering, then braking, then Car.update), except that the screen
+        does not wrap and the car angle is not wrapped to 0-360 degrees.
+
+        Returns the (T, K) arrays px, py, and theta_deg after each frame,
+        written into out if it is given. The frames are simulated in blocks
+        of about block_size values (frames times sequences).
+    """
+    p = rollout_parameters(state)
+    i = car_state.STATE_INDEX
+    (K, T) = throttle.shape
+    dt = p.time_delta
+    if out is None:
+        out = (np.empty((T, K)), np.empty((T, K)), np.empty((T, K)))
+    (px_out, py_out, theta_out) = out
+
+    # Per-action values, looked up for a block of frames at once.
+    # Throttle: the velocity change from the acceleration the action sets,
+    # and the speeds at which Car.brake (a car that is not moving forwards)
+    # or Car.check_stop_acceleration (a slow coasting car) stop the car
+    dv_table = np.array((p.a_friction * dt, p.max_a * dt, p.a_brake * dt))
+    stop_low = np.array((-5.0, np.inf, -np.inf))
+    stop_high = np.array((5.0, -np.inf, 0.0))
+    # Steering: the tire angle step, and the tire angle up to which
+    # Car.turn_none zeroes the tires (never while turning)
+    step_table = np.array((-1.0, 0.0, 1.0))
+    zero_table = np.array((-1.0, 0.1, -1.0))
+
+    max_v = p.max_v
+    max_tire = p.max_tire_angle_deg
+    wb_ac = p.wheelbase * p.a_max_centripetal
+    # 0.80**(vx/max_v) as an exponential, which numpy computes faster
+    decay_rate = np.log(0.80) / max_v
+    turn_rate = dt / p.wheelbase * 180/pi
+
+    # Nothing the steering does feeds back into the speed, so each block of
+    # frames runs in stages: the speed, then the tire angle (the only other
+    # frame by frame recurrence), then the heading and the position as
+    # running sums over the whole block. np.cumsum adds up the frames in
+    # order, the same as stepping the Car. Blocks of about block_size
+    # values keep the temporary arrays in the CPU cache.
+    B = max(1, min(T, block_size // max(K, 1)))
+    # One contiguous row of actions per frame
+    throttle_t = np.ascontiguousarray(throttle.T)
+    steer_t = np.ascontiguousarray(steer.T)
+    vx_all = np.empty((B + 1, K))
+    vx_all[0] = state[i["vx"]]
+    tires = np.empty((B, K))
+    tire = np.full(K, float(state[i["tire_angle_deg"]]))
+    theta = state[i["theta_deg"]]
+    (px, py) = (state[i["px_global"]], state[i["py_global"]])
+    for start in range(0, T, B):
+        end = min(T, start + B)
+        n = end - start
+        throttle_action = throttle_t[start:end]
+        dv_set = dv_table.take(throttle_action)
+        low = stop_low.take(throttle_action)
+        high = stop_high.take(throttle_action)
+        steer_action = steer_t[start:end]
+        step = step_table.take(steer_action)
+        zero = zero_table.take(steer_action)
+
+        for t in range(n):
+            # Car.brake and Car.check_stop_acceleration
+            vx = vx_all[t]
+            stop = (vx >= low[t]) & (vx <= high[t])
+            dv = np.where(stop, 0.0, dv_set[t])
+            vx = np.where(stop, 0.0, vx)
+
+            # Car.calculate_velocity
+            new_vx = np.add(vx, dv, out=vx_all[t + 1])
+            over = new_vx > max_v
+            if over.any():
+                snap = over & (np.abs(max_v - vx) <= dv)
+                np.copyto(new_vx, vx, where=over)
+                np.putmask(new_vx, snap, max_v)
+        # The speed at the start of every frame, which the steering sees,
+        # and at the end of it, which moves the car
+        vx_prev = vx_all[:n]
+        vx_new = vx_all[1:n + 1]
+
+        # Car.turn_none decays the tire angle, and Car.turn limits it by
+        # the max centripetal acceleration. At a standstill the limit is 90
+        # degrees, which (like max_theoretical_tire_angle_rad) does not
+        # clamp the tires.
+        decay = np.exp(vx_prev * decay_rate)
+        np.putmask(decay, steer_action != STRAIGHT, 1.0)
+        with np.errstate(divide='ignore'):
+            max_theory = np.arctan(wb_ac / (vx_prev * vx_prev))
+        max_theory *= 180/pi
+        min_theory = -max_theory
+        for t in range(n):
+            # Car.turn_left, Car.turn_right, and Car.turn_none
+            # (the step only applies if it stays within the max tire angle)
+            stepped = tire + step[t]
+            np.copyto(tire, stepped, where=step[t] * stepped <= max_tire)
+            turned = np.multiply(tire, decay[t], out=tires[t])
+            np.clip(turned, min_theory[t], max_theory[t], out=turned)
+            tire = np.where(np.abs(turned) <= zero[t], 0.0, turned)
+
+        # Car.turn, then Car.calculate_position, carrying on from the last
+        # frame of the previous block
+        d_theta = sin_cos_deg(tires[:n], decay, max_theory)[0]
+        d_theta *= vx_prev
+        d_theta *= turn_rate
+        d_theta[0] += theta
+        theta = np.cumsum(d_theta, axis=0, out=theta_out[start:end])[-1]
+
+        (dy, dx) = sin_cos_deg(theta_out[start:end], tires[:n], min_theory)
+        dx *= vx_new
+        dx *= dt
+        dx[0] += px
+        px = np.cumsum(dx, axis=0, out=px_out[start:end])[-1]
+        dy *= vx_new
+        dy *= -dt
+        dy[0] += py
+        py = np.cumsum(dy, axis=0, out=py_out[start:end])[-1]
+        vx_all[0] = vx_all[n]
+    return out
+
+
+class Waypoint_Cost:
+    """ Minimum time through a list of waypoints, in order. A rollout that
+        misses waypoints costs the full horizon, plus miss_penalty per
+        missed waypoint, plus its closest distance to the first one missed.
+    """
+    def __init__(self, waypoints: Sequence[tuple], radius: float,
+                 miss_penalty: float = 10.0,
+                 distance_weight: float = 0.01) -> None:
+        self.waypoints = np.asarray(waypoints, dtype=float)
+        self.radius = radius
+        self.miss_penalty = miss_penalty
+        self.distance_weight = distance_weight
+
+    def __call__(self, px, py, theta, dt: float) -> np.ndarray:
+        """ Returns the cost of each rollout from (T, K) trajectories. """
+        (T, K) = px.shape
+        frames = np.arange(T)[:, None]
+        reached = np.ones(K, dtype=bool)
+        t_reached = np.zeros(K, dtype=int)
+        n_missed = np.zeros(K)
+        gap = np.zeros(K)
+        for (wx, wy) in self.waypoints:
+            d2 = (px - wx)**2 + (py - wy)**2
+            # Only frames after the previous waypoint count
+            d2[frames < t_reached] = np.inf
+            inside = d2 <= self.radius**2
+            hit = reached & inside.any(axis=0)
+            first_miss = reached & ~hit
+            gap[first_miss] = np.sqrt(d2.min(axis=0))[first_miss]
+            t_reached = np.where(hit, inside.argmax(axis=0), t_reached)
+            n_missed += ~hit
+            reached = hit
+        time = np.where(reached, (t_reached + 1) * dt, T * dt)
+        return (time + self.miss_penalty * n_missed
+                + self.distance_weight * gap)
+
+
+class U_Turn_Cost:
+    """ The tightest U-turn: the widest sideways distance covered before
+        the car faces the opposite way, plus time_weight per second taken.
+        A rollout that never turns around costs miss_penalty plus the
+        degrees it was short.
+    """
+    def __init__(self, start_state, time_weight: float = 1.0,
+                 miss_penalty: float = 1000.0,
+                 tolerance_deg: float = 5.0) -> None:
+        i = car_state.STATE_INDEX
+        self.px0 = start_state[i["px_global"]]
+        self.py0 = start_state[i["py_global"]]
+        self.theta0 = start_state[i["theta_deg"]]
+        self.time_weight = time_weight
+        self.miss_penalty = miss_penalty
+        self.tolerance_deg = tolerance_deg
+
+    def __call__(self, px, py, theta, dt: float) -> np.ndarray:
+        """ Returns the cost of each rollout from (T, K) trajectories. """
+        (T, K) = px.shape
+        theta0 = self.theta0 * pi/180
+        # Sideways distance from the starting line of travel
+        lateral = np.abs((px - self.px0) * np.sin(theta0)
+                         + (py - self.py0) * np.cos(theta0))
+        turned = np.abs(theta - self.theta0)
+        done = turned >= 180 - self.tolerance_deg
+        finished = done.any(axis=0)
+        t_done = np.where(finished, done.argmax(axis=0), T - 1)
+        lateral[np.arange(T)[:, None] > t_done] = 0.0
+        cost = lateral.max(axis=0) + self.time_weight * (t_done + 1) * dt
+        short = 180 - turned.max(axis=0)
+        return np.where(finished, cost, self.miss_penalty + short)
+
+
+class Maneuver_Optimizer:
+    """ Cross-entropy method over throttle and steering actions. Each
+        sampled action is held for hold frames, so the search is over
+        horizon/hold decisions rather than every frame.
+
+        An iteration costs about n_samples * horizon: on a single slow
+        core, the rollout of 1000 samples over 240 frames takes about 16
+        ms, and 4000 samples about 60 ms.
+    """
+    def __init__(self, cost, horizon: int,
+                 hold: int = 6,
+                 n_samples: int = 1000,
+                 elite_fraction: float = 0.05,
+                 smoothing: float = 0.7,
+                 min_prob: float = 0.02,
+                 seed: int = None) -> None:
+        self.cost = cost
+        self.hold = hold
+        self.n_decisions = -(-horizon // hold)
+        self.horizon = horizon
+        self.n_samples = n_samples
+        self.n_elite = max(1, int(elite_fraction * n_samples))
+        self.smoothing = smoothing
+        self.min_prob = min_prob
+        self.rng = np.random.default_rng(seed)
+        # Rollout output buffers, reused every iteration
+        self.buffers = tuple(np.empty((horizon, n_samples)) for _ in range(3))
+
+    def sample(self, probs: np.ndarray) -> np.ndarray:
+        """ Samples n_samples decision sequences from (D, 3) probabilities.
+        """
+        cumulative = np.cumsum(probs, axis=1)
+        u = self.rng.random((self.n_samples, len(probs)))
+        return ((u > cumulative[:, 0]).astype(np.int8)
+                + (u > cumulative[:, 1]))
+
+    def to_frames(self, decisions: np.ndarray) -> np.ndarray:
+        """ Expands (..., D) decisions into (..., horizon) per-frame actions.
+        """
+        frames = np.repeat(decisions, self.hold, axis=-1)
+        return frames[..., :self.horizon]
+
+    def refit(self, probs: np.ndarray, elites: np.ndarray) -> np.ndarray:
+        """ Moves (D, 3) probabilities towards the elite action frequencies.
+        """
+        frequencies = np.stack([(elites == action).mean(axis=0)
+                                for action in range(3)], axis=1)
+        probs = (1 - self.smoothing) * probs + self.smoothing * frequencies
+        # Keep some exploration so no action is ruled out for good
+        probs = np.maximum(probs, self.min_prob)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def optimize(self, state,
+                 max_iterations: int = 50,
+                 target_cost: float = -np.inf,
+                 patience: int = 5,
+                 tolerance: float = 1e-3,
+                 warm_start: Optimization_Result = None
+                 ) -> Optimization_Result:
+        """ Searches for the best control sequence from a car_state buffer.
+
+            Stops early once the cost reaches target_cost, or after it has
+            not improved by tolerance for patience iterations. A previous
+            result (with the same horizon and hold) can be passed as
+            warm_start to continue from its action probabilities and best
+            sequence.
+
+            Only kinematic states are supported (see rollout_parameters).
+        """
+        if max_iterations < 1:
+            raise ValueError(f"max_iterations={max_iterations} must be at "
+                             "least 1.")
+        dt = rollout_parameters(state).time_delta
+        D = self.n_decisions
+        if warm_start is not None:
+            throttle_probs = warm_start.throttle_probs.copy()
+            steer_probs = warm_start.steer_probs.copy()
+            best = (warm_start.throttle[::self.hold],
+                    warm_start.steer[::self.hold])
+        else:
+            throttle_probs = np.full((D, 3), 1/3)
+            steer_probs = np.full((D, 3), 1/3)
+            best = None
+        best_cost = np.inf
+
+        history = []
+        stale = 0
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            throttle = self.sample(throttle_probs)
+            steer = self.sample(steer_probs)
+            # Always re-evaluate the best sequence so far
+            if best is not None:
+                (throttle[0], steer[0]) = best
+
+            (px, py, theta) = rollout(
+                state, self.to_frames(throttle), self.to_frames(steer),
+                out=self.buffers)
+            costs = self.cost(px, py, theta, dt)
+
+            elite = np.argpartition(costs, self.n_elite - 1)[:self.n_elite]
+            throttle_probs = self.refit(throttle_probs, throttle[elite])
+            steer_probs = self.refit(steer_probs, steer[elite])
+
+            i_best = np.argmin(costs)
+            if costs[i_best] < best_cost - tolerance:
+                stale = 0
+            else:
+                stale += 1
+            if costs[i_best] <= best_cost:
+                best_cost = float(costs[i_best])
+                best = (throttle[i_best].copy(), steer[i_best].copy())
+            history.append(best_cost)
+
+            if best_cost <= target_cost or stale >= patience:
+                break
+
+        return Optimization_Result(
+            throttle=self.to_frames(best[0]), steer=self.to_frames(best[1]),
+            cost=best_cost, iterations=iteration,
+            throttle_probs=throttle_probs, steer_probs=steer_probs,
+            cost_history=history)
+
+
+def replay(car, result: Optimization_Result) -> None:
+    """ Drives a Car through an optimized control sequence, calling its
+        methods in the same order as main_game.main_loop.
+    """
+    for (throttle, steer) in zip(result.throttle, result.steer):
+        drive_frame(car, throttle, steer)
+
+
+def drive_frame(car, throttle: int, steer: int) -> None:
+    """ Applies one frame of controls to a Car and updates it. """
+    if throttle != BRAKE:
+        getattr(car, THROTTLE_ACTIONS[throttle])()
+    getattr(car, STEER_ACTIONS[steer])()
+    if throttle == BRAKE:
+        car.brake()
+    car.update()
+
+
+def check_rollout_parity(car, frames: int = 300, seed: int = 0,
+                         tolerance: float = 1e-9) -> float:
+    """ Drives a real Car and a rollout through the same random controls
+        and raises a RuntimeError if they drift apart by more than
+        tolerance pixels (or degrees) on any frame. Returns the largest
+        difference. The car is restored to its starting state afterwards.
+
+        Run this after changing rollout or the Car physics.
+    """
+    start = car_state.save_state(car)
+    car.screen_wrap_on = False
+    state = car_state.save_state(car)
+    rng = np.random.default_rng(seed)
+    throttle = rng.choice(3, size=(1, frames), p=(0.2, 0.6, 0.2))
+    steer = rng.integers(0, 3, size=(1, frames))
+    (px, py, theta) = rollout(state, throttle, steer)
+
+    worst = 0.0
+    for t in range(frames):
+        drive_frame(car, throttle[0, t], steer[0, t])
+        # The Car keeps its angle within 0-360 degrees, the rollout does not
+        theta_error = (car.theta_deg - theta[t, 0] + 180) % 360 - 180
+        worst = max(worst, abs(car.px_global - px[t, 0]),
+                    abs(car.py_global - py[t, 0]), abs(theta_error))
+    car_state.restore_state(car, start)
+
+    if worst > tolerance:
+        raise RuntimeError(f"Rollout differs from Car by {worst:.3g} "
+                           f"(tolerance {tolerance:.3g}).")
+    return worst
+
+
+if __name__ == '__main__':
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    import config
+    import car
+
+    screen = pygame.display.set_mode(config.RESOLUTION)
+    demo_car = car.Car(screen=screen, position=(100, 600))
+    demo_car.speedometer_on = False
+    print(f"rollout parity with Car: {check_rollout_parity(demo_car):.2g}")
+    # Start from rest for the waypoints, and at 20 mph for the U-turn
+    state_at_rest = car_state.save_state(demo_car)
+    demo_car.vx = 20 / demo_car.max_v_mph * demo_car.max_v
+    state_moving = car_state.save_state(demo_car)
+
+    goals = (
+        ("waypoints", state_at_rest, Waypoint_Cost(
+            [(250, 600), (400, 500), (400, 350)], radius=25), 480),
+        ("U-turn", state_moving, U_Turn_Cost(state_moving), 360))
+    for (name, state, cost, horizon) in goals:
+        optimizer = Maneuver_Optimizer(cost, horizon=horizon, seed=0)
+        start = perf_counter()
+        result = optimizer.optimize(state)
+        elapsed_ms = (perf_counter() - start) * 1000
+        print(f"{name}: cost {result.cost:.3f} after "
+              f"{result.iterations} iterations, "
+              f"{elapsed_ms / result.iterations:.1f} ms per iteration")
+
+        start = perf_counter()
+        result = optimizer.optimize(state, warm_start=result)
+        elapsed_ms = (perf_counter() - start) * 1000
+        print(f"{name} (warm start): cost {result.cost:.3f} after "
+              f"{result.iterations} iterations, "
+              f"{elapsed_ms / result.iterations:.1f} ms per iteration")